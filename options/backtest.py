@@ -1,6 +1,8 @@
-from datetime import datetime
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator
 
-from models import OptionPosition
+from models import Option, OptionPosition
 from services.base import OptionsDataService, AssetDataService
 from strategies import OpeningStrategyType, ClosingStrategyType
 
@@ -28,56 +30,187 @@ def closing_profit_each_timestamp(positions: list[OptionPosition], df: pd.DataFr
     return np.array(profits)
 
 
-def daily_potential_pnl(
+def has_traded(df: pd.DataFrame, options: list[Option], until: pd.Timestamp | None = None) -> bool:
+    """Return whether each of the options has at least one actual bar in the given dataframe (up to `until`, inclusive).
+    Minutes filled in by the data services (see `OptionsDataService.full_day_minutely_data`) have zero volume, so they don't count."""
+    if df.empty:
+        return False
+    traded = (df["volume"] > 0).to_numpy()
+    if until is not None:
+        traded = traded & (df.index.get_level_values("timestamp") <= until)
+    traded_tickers = set(df.index.get_level_values("symbol")[traded])
+    return all(opt.ticker in traded_tickers for opt in options)
+
+
+def carry_over_closes(df: pd.DataFrame, last_closes: dict[str, float]) -> pd.DataFrame:
+    """Return a copy of the given dataframe where the minutes before each ticker's first actual bar of the day
+    hold its last known close from the previous day (given by `last_closes`), instead of whatever the data service filled in."""
+    df = df.copy()
+    symbols = df.index.get_level_values("symbol")
+    timestamps = df.index.get_level_values("timestamp")
+    traded = (df["volume"] > 0).to_numpy()
+    for ticker, close in last_closes.items():
+        rows = symbols == ticker
+        if not (rows & traded).any():
+            continue
+        df.loc[rows & (timestamps < timestamps[rows & traded].min()), "close"] = close
+    return df
+
+
+def closes_at_end_of_day(df: pd.DataFrame, options: list[Option]) -> dict[str, float]:
+    """Return the close of the last minute in the given dataframe for each of the options."""
+    return {
+        opt.ticker: float(df.xs(opt.ticker, level="symbol")["close"].sort_index().iloc[-1])
+        for opt in options
+    }
+
+
+@dataclass
+class HeldPositions:
+    """Positions opened together by an opening strategy, held until the latest expiry among them."""
+    positions: list[OptionPosition]
+    expiry_date: datetime
+    pnl_chunks: list[NDArray] = field(default_factory=list)  # one per day the positions were held
+    last_closes: dict[str, float] = field(default_factory=dict)  # ticker -> close at the end of the last held day
+    incomplete: bool = False  # whether the options data was missing on some of the days the positions were held
+
+    @property
+    def options(self) -> list[Option]:
+        return [pos.option for pos in self.positions]
+
+    def is_held_on(self, day: datetime) -> bool:
+        return not self.incomplete and day.date() <= self.expiry_date.date()
+
+    def mark_incomplete(self) -> None:
+        self.incomplete = True
+        self.pnl_chunks.clear()
+        self.last_closes.clear()
+
+    def hold_through(self, df_day_options: pd.DataFrame) -> None:
+        """Append the profit/loss movement of another held day, continuing each leg from its last known close
+        until it first trades on that day."""
+        df_day_options = carry_over_closes(df_day_options, self.last_closes)
+        self.pnl_chunks.append(closing_profit_each_timestamp(self.positions, df_day_options))
+        self.last_closes = closes_at_end_of_day(df_day_options, self.options)
+
+    @property
+    def pnl_movement(self) -> NDArray:
+        """The profit/loss movement (1-minute granularity) stitched across all the days the positions were held,
+        or NaN if some of those days are missing."""
+        if self.incomplete:
+            return np.nan  # type: ignore
+        return np.concatenate(self.pnl_chunks)
+
+
+def potential_pnl_stream(
     start_date: datetime,
     end_date: datetime,
     asset: str,
     asset_data_service: AssetDataService,
     options_data_service: OptionsDataService,
     opening_strategy: OpeningStrategyType,
-) -> list[NDArray]:
-    """Perform a simulation of the given opening strategy.
-    Return the intra-day profit/loss position movements (1-minute granularity)"""
-
-    # money = 0
-    # results = []
-    daily_pnl_movements = []
+) -> Iterator[NDArray]:
+    """Perform a simulation of the given opening strategy, one day at a time.
+    Yield the profit/loss movement (1-minute granularity) of the positions opened on each day, in opening order,
+    from their opening until their expiry (or the end of the date range, if they expire later).
+    NaN is yielded instead for days which are skipped, as well as for positions with missing options data on some held day.
+    Unlike the original same-day implementation, a day is also skipped if any of the new legs has no actual bar
+    at or before the opening minute (e.g. an illiquid wing), rather than opening it at a carried forward or filler price;
+    so even 0DTE runs may skip days which used to be simulated.
+    On held days, each leg continues from its last known close until it first trades on that day.
+    Only the positions which are still held (or waiting for earlier ones to be yielded) are kept in memory."""
+
+    held: dict[int, HeldPositions | None] = {}  # opening day index -> positions (None if skipped)
+    next_to_yield = 0
     skipped_days = 0
-
-    df_asset = asset_data_service.daily_candles_data(start_date, end_date, asset)
-
-    for timestamp in tqdm(df_asset.index.get_level_values("timestamp").unique()):
-        day = timestamp.to_pydatetime()
-        df_day_stock = asset_data_service.full_day_minutely_data(day, asset)
+    incomplete_positions = 0
+
+    for day_idx, (day, df_day_stock) in enumerate(tqdm(asset_data_service.minutely_data_stream(start_date, end_date, asset))):
+        # positions opened on earlier days
+        still_held = [h for h in held.values() if h is not None and h.is_held_on(day)]
+        if still_held:
+            held_options = list({opt.ticker: opt for h in still_held for opt in h.options}.values())
+            df_day_held_options = options_data_service.full_day_minutely_data(day, held_options)
+            for h in still_held:
+                if has_traded(df_day_held_options, h.options):
+                    h.hold_through(df_day_held_options)
+                else:
+                    # don't stitch the curve across the missing day
+                    h.mark_incomplete()
+                    incomplete_positions += 1
+
+        # positions opened today (fetched separately, so that the data of the held ones doesn't mask missing data of the new ones)
         opening_timestamp, legs = opening_strategy(df_day_stock)
         df_day_options = options_data_service.full_day_minutely_data(day, [leg.option for leg in legs])
 
-        # data is incomplete, so if opening_timestamp is before the beginning of the options data, skip this day
-        if opening_timestamp < df_day_options.index.get_level_values("timestamp").min():
+        # data is incomplete, so if opening_timestamp is before the beginning of the options data
+        # (or some leg hasn't traded yet, e.g. because no such contract is listed), skip this day
+        if not has_traded(df_day_options, [leg.option for leg in legs], until=opening_timestamp) \
+                or opening_timestamp < df_day_options.index.get_level_values("timestamp").min():
             skipped_days += 1
-            # results.append(money)
-            # add na value for the sake of shape-matching
-            daily_pnl_movements.append(np.nan)
-            continue
-
-        positions = [leg.opening_position(float(df_day_options.loc[(leg.option.ticker, opening_timestamp), "open"])) for leg in legs]  # type: ignore
-        df_day_remaining = df_day_options[df_day_options.index.get_level_values("timestamp") >= opening_timestamp]
-        potential_profits = closing_profit_each_timestamp(positions, df_day_remaining)
-        daily_pnl_movements.append(potential_profits)
+            held[day_idx] = None
+        else:
+            positions = [leg.opening_position(float(df_day_options.loc[(leg.option.ticker, opening_timestamp), "open"])) for leg in legs]  # type: ignore
+            df_day_remaining = df_day_options[df_day_options.index.get_level_values("timestamp") >= opening_timestamp]
+            held[day_idx] = HeldPositions(
+                positions,
+                max(leg.option.expiry_date for leg in legs),
+                [closing_profit_each_timestamp(positions, df_day_remaining)],
+                closes_at_end_of_day(df_day_remaining, [leg.option for leg in legs]),
+            )
+
+        # yield in opening order, as soon as the positions expire
+        while next_to_yield in held:
+            h = held[next_to_yield]
+            if h is not None and h.is_held_on(day + timedelta(days=1)):
+                break
+            del held[next_to_yield]
+            next_to_yield += 1
+            # add na value for skipped days for the sake of shape-matching
+            yield np.nan if h is None else h.pnl_movement  # type: ignore
+
+    # positions expiring after the end of the date range, cut at the last day
+    if any(h is not None and not h.incomplete for h in held.values()):
+        print(f"Cut {sum(h is not None and not h.incomplete for h in held.values())} positions expiring after the end of the date range.")
+    for day_idx in sorted(held):
+        h = held[day_idx]
+        yield np.nan if h is None else h.pnl_movement  # type: ignore
 
     if skipped_days > 0:
         print(f"Skipped {skipped_days} days due to incomplete data. (inserted np.nan for them)")
+    if incomplete_positions > 0:
+        print(f"Dropped {incomplete_positions} positions due to missing data on some of their held days. (inserted np.nan for them)")
 
-    return daily_pnl_movements
+
+def daily_potential_pnl(
+    start_date: datetime,
+    end_date: datetime,
+    asset: str,
+    asset_data_service: AssetDataService,
+    options_data_service: OptionsDataService,
+    opening_strategy: OpeningStrategyType,
+) -> list[NDArray]:
+    """Perform a simulation of the given opening strategy.
+    Return the profit/loss movements (1-minute granularity) of the positions opened on each day,
+    from their opening until their expiry (see `potential_pnl_stream`)."""
+
+    return list(potential_pnl_stream(
+        start_date,
+        end_date,
+        asset,
+        asset_data_service,
+        options_data_service,
+        opening_strategy,
+    ))
 
 
 def perform_closing_strategy(
     closing_strategy: ClosingStrategyType,
-    daily_pnl_movements: list[NDArray],
+    daily_pnl_movements: Iterable[NDArray],
     starting_money = 0,
 ) -> pd.DataFrame:
-    """Perform the closing strategy on the given daily potential P&L movements.
-    Return the total value of the portfolio at the end of each day"""
+    """Perform the closing strategy on the given potential P&L movements of each day's positions.
+    Return the total value of the portfolio after closing each day's positions"""
 
     money = starting_money
     results = []
@@ -91,7 +224,7 @@ def perform_closing_strategy(
         money += closing_profit
         results.append(money)
 
-    results_df = pd.DataFrame(results, index=range(len(daily_pnl_movements)), columns=["total_profit"])
+    results_df = pd.DataFrame(results, index=range(len(results)), columns=["total_profit"])
 
     return results_df
 
@@ -104,58 +237,113 @@ def do_simulation(
     options_data_service: OptionsDataService,
     opening_strategy: OpeningStrategyType,
     closing_strategy: ClosingStrategyType,
-) -> tuple[pd.DataFrame, list[NDArray]]:
+) -> pd.DataFrame:
     """Perform a simulation of the given strategies.
-    Return the value of the portfolio at the end of each day,
-    as well as the intra-day profit/loss position movements (1-minute granularity)"""
-
-    daily_pnl_movements = daily_potential_pnl(
-        start_date,
-        end_date,
-        asset,
-        asset_data_service,
-        options_data_service,
-        opening_strategy,
-    )
+    Return the value of the portfolio after closing each day's positions.
+    The positions' P&L movements are consumed as they are streamed, so they are not kept in memory;
+    use `potential_pnl_stream` or `daily_potential_pnl` to get them."""
 
-    profit_df = perform_closing_strategy(
+    return perform_closing_strategy(
         closing_strategy,
-        daily_pnl_movements,
+        potential_pnl_stream(
+            start_date,
+            end_date,
+            asset,
+            asset_data_service,
+            options_data_service,
+            opening_strategy,
+        ),
     )
 
-    return profit_df, daily_pnl_movements
-
 
 
 if __name__ == "__main__":
-    import matplotlib.pyplot as plt
-
-    from services.alpaca import AlpacaAssetDataService, AlpacaOptionsDataService
-    from strategies import *
-
-    start_date = datetime(2024, 4, 1)  # farthest back we have data for from Alpaca is 2024-02-05
-    end_date = datetime(2024, 4, 10)
-    asset = "SPY"
-
-    asset_data_service = AlpacaAssetDataService()
-    options_data_service = AlpacaOptionsDataService()
-    opening_strategy = opening_strategy_iron_condor_specific_minute_idx(2)
-    closing_strategy = closing_strategy_limit_or_stoploss_or_last_n(400, 1000, 30)
+    # smoke test with in-memory data services
+
+    from services.fake import FakeAssetDataService, FakeOptionsDataService, TRADING_DAYS
+    from strategies import opening_strategy_iron_condor_specific_minute_idx
+
+    def old_same_day_pnl(options_data_service: OptionsDataService) -> list[NDArray]:
+        """The original (0DTE only) implementation of `daily_potential_pnl`."""
+        movements = []
+        opening_strategy = opening_strategy_iron_condor_specific_minute_idx(1)
+        for day in TRADING_DAYS:
+            opening_timestamp, legs = opening_strategy(FakeAssetDataService().full_day_minutely_data(day.to_pydatetime(), "XYZ"))
+            df_day_options = options_data_service.full_day_minutely_data(day.to_pydatetime(), [leg.option for leg in legs])
+            if df_day_options.empty or opening_timestamp < df_day_options.index.get_level_values("timestamp").min():
+                movements.append(np.nan)
+                continue
+            positions = [leg.opening_position(float(df_day_options.loc[(leg.option.ticker, opening_timestamp), "open"])) for leg in legs]  # type: ignore
+            df_day_remaining = df_day_options[df_day_options.index.get_level_values("timestamp") >= opening_timestamp]
+            movements.append(closing_profit_each_timestamp(positions, df_day_remaining))
+        return movements
+
+    def lengths(movements: list[NDArray]) -> list[int | None]:
+        """Length of each movement, None for NaN ones."""
+        return [None if np.isnan(m).all() else len(m) for m in movements]
+
+    def simulate(days_to_expiry: int, options_data_service: OptionsDataService | None = None) -> list[NDArray]:
+        return daily_potential_pnl(
+            TRADING_DAYS[0].to_pydatetime(),
+            TRADING_DAYS[-1].to_pydatetime(),
+            "XYZ",
+            FakeAssetDataService(),
+            options_data_service or FakeOptionsDataService(),
+            opening_strategy_iron_condor_specific_minute_idx(1, days_to_expiry),
+        )
 
-    profit_df, _ = do_simulation(
-        start_date,
-        end_date,
-        asset,
+    print("0DTE with every leg trading each minute gives the same output as the old same-day implementation:")
+    for missing_days in [(), (2,)]:
+        new = simulate(0, FakeOptionsDataService(missing_days))
+        old = old_same_day_pnl(FakeOptionsDataService(missing_days))
+        print(f"  missing days {missing_days}: {lengths(new)}")
+        assert lengths(new) == lengths(old)
+        assert all(np.array_equal(n, o, equal_nan=True) for n, o in zip(new, old))
+
+    print("...but unlike it, skips days where some leg hasn't traded by the opening minute:")
+    new = simulate(0, FakeOptionsDataService(late_days={2: 3}))
+    old = old_same_day_pnl(FakeOptionsDataService(late_days={2: 3}))
+    print(f"  new: {lengths(new)}, old: {lengths(old)}")
+    assert lengths(new) == [4, None, 4, 4, 4, 4] and lengths(old) == [4, 4, 4, 4, 4, 4]
+
+    print("2DTE positions overlap, are stitched across days and cut at the end of the range:")
+    new = simulate(2)
+    print(f"  {lengths(new)}")
+    # opened on minute idx 1, so 4 minutes on the opening day and 5 on each following one until expiry;
+    # Thursday's expire on Monday, Friday's and Monday's would expire after the last day
+    assert lengths(new) == [14, 14, 14, 14, 9, 4]
+    assert all(np.array_equal(m[:4], o) for m, o in zip(new, simulate(0)))  # opening days are the same as 0DTE
+
+    print("2DTE legs starting to trade late on a held day continue from their last close, without jumps:")
+    new = simulate(2, FakeOptionsDataService(late_days={2: 3}))
+    print(f"  {lengths(new)}, Monday's: {np.round(new[0], 2).tolist()}")
+    assert lengths(new) == [14, None, 14, 14, 9, 4]
+    assert (new[0][4:7] == new[0][3]).all()  # Tuesday's first 3 minutes hold Monday's last P&L
+    assert new[0][7] != new[0][3]
+
+    print("2DTE positions with missing data on a held day are dropped, not stitched across the gap:")
+    new = simulate(2, FakeOptionsDataService(missing_days=(2,)))
+    print(f"  {lengths(new)}")
+    assert lengths(new) == [None, None, 14, 14, 9, 4]
+
+    print("Positions expiring on a holiday (no such contract listed) are skipped:")
+    new = simulate(2, FakeOptionsDataService(holidays=(10,)))
+    print(f"  {lengths(new)}")
+    assert lengths(new) == [14, 14, 14, 14, 9, None]
+
+    print("Positions are yielded in opening order as soon as they expire:")
+    asset_data_service = FakeAssetDataService()
+    stream = potential_pnl_stream(
+        TRADING_DAYS[0].to_pydatetime(),
+        TRADING_DAYS[-1].to_pydatetime(),
+        "XYZ",
         asset_data_service,
-        options_data_service,
-        opening_strategy,
-        closing_strategy,
+        FakeOptionsDataService(),
+        opening_strategy_iron_condor_specific_minute_idx(1, 2),
     )
+    first = next(stream)
+    print(f"  first position (opened on Monday) yielded after fetching {len(asset_data_service.requested_days)} days")
+    assert len(first) == 14 and len(asset_data_service.requested_days) == 3  # expired on Wednesday
+    assert lengths([first, *stream]) == [14, 14, 14, 14, 9, 4]
 
-    print("Simulation complete.")
-    daily_profit_df = profit_df.dropna().diff()
-    print(f"Winning rate: {daily_profit_df[daily_profit_df['total_profit'] > 0].shape[0] / daily_profit_df.shape[0]:.2%}")
-    
-    fig, ax = plt.subplots()
-    profit_df.plot(ax=ax)
-    plt.show()
\ No newline at end of file
+    print("All OK!")
@@ -0,0 +1,278 @@
+"""
+Command-line backtest runner driven by JSON run configs.
+
+Heavy dependencies (pandas, numpy, the data SDKs, ...) are only imported
+by the subcommands that actually need them, so `--help` and runs whose
+results are already on disk return almost instantly.
+
+Example run config:
+
+    {
+        "asset": "SPY",
+        "start_date": "2024-04-01",
+        "end_date": "2024-04-10",
+        "data_source": "alpaca",
+        "opening_strategy": {"name": "iron_condor_specific_minute_idx", "params": {"minute_idx": 2, "days_to_expiry": 0}},
+        "closing_strategy": {"name": "limit_or_stoploss_or_last_n", "params": {"limit_value": 400, "stoploss_value": 1000, "n": 30}}
+    }
+
+Strategy names may be given with or without their `opening_strategy_` / `closing_strategy_` prefix.
+Functions returning a strategy (annotated to return `OpeningStrategyType` / `ClosingStrategyType`)
+are called with `params` (`{}` if omitted); the others are used as the strategy itself
+and take no `params` (e.g. `{"name": "last"}`).
+
+P&L movements are written as JSON lines, with `null` for skipped days (see `load_pnl_movements`).
+
+Usage:
+
+    python cli.py run config.json [more_configs.json ...] [--output-dir results] [--force]
+    python cli.py strategies
+"""
+
+import argparse
+from datetime import datetime
+import hashlib
+import importlib
+import inspect
+import json
+from pathlib import Path
+import sys
+import traceback
+from typing import IO, TYPE_CHECKING, Iterable, Iterator
+
+if TYPE_CHECKING:
+    from numpy.typing import NDArray
+
+    from services.base import AssetDataService, OptionsDataService
+    from strategies import OpeningStrategyType, ClosingStrategyType
+
+
+# data source name -> (module, asset data service class, options data service class)
+DATA_SOURCES = {
+    "alpaca": ("services.alpaca", "AlpacaAssetDataService", "AlpacaOptionsDataService"),
+}
+
+REQUIRED_KEYS = ("asset", "start_date", "end_date", "opening_strategy", "closing_strategy")
+
+CONFIG_FILENAME = "config.json"
+PROFIT_FILENAME = "profit.csv"
+MOVEMENTS_FILENAME = "daily_pnl_movements.jsonl"
+
+
+def load_config(path: Path) -> dict:
+    """Read and validate a run config. Raise `ValueError` if it is malformed."""
+    try:
+        config = json.loads(path.read_text())
+    except (OSError, json.JSONDecodeError) as e:
+        raise ValueError(f"cannot read run config {path}: {e}") from e
+
+    missing = [key for key in REQUIRED_KEYS if key not in config]
+    if missing:
+        raise ValueError(f"run config {path} is missing keys: {', '.join(missing)}")
+
+    config.setdefault("data_source", "alpaca")
+    if config["data_source"] not in DATA_SOURCES:
+        raise ValueError(f"unknown data source {config['data_source']!r} in run config {path}, expected one of: {', '.join(DATA_SOURCES)}")
+
+    for key in ("start_date", "end_date"):
+        try:
+            datetime.fromisoformat(config[key])
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"invalid {key} {config[key]!r} in run config {path}") from e
+    if datetime.fromisoformat(config["end_date"]) < datetime.fromisoformat(config["start_date"]):
+        raise ValueError(f"end_date is before start_date in run config {path}")
+
+    for key in ("opening_strategy", "closing_strategy"):
+        spec = config[key]
+        if not isinstance(spec, dict) or "name" not in spec:
+            raise ValueError(f"{key} in run config {path} must be an object with a 'name'")
+
+    return config
+
+
+def output_dir_for(path: Path, config: dict, output_root: Path) -> Path:
+    """Return the results directory of `config`, named after its file and keyed by a hash of its contents,
+    so that configs with the same file name (or edited configs) never share results."""
+    digest = hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()[:10]
+    return output_root / f"{path.stem}-{digest}"
+
+
+def is_cached(config: dict, output_dir: Path) -> bool:
+    """Return whether `output_dir` already holds the results of a run with the same config."""
+    try:
+        cached_config = json.loads((output_dir / CONFIG_FILENAME).read_text())
+    except (OSError, json.JSONDecodeError):
+        return False
+    return cached_config == config \
+        and (output_dir / PROFIT_FILENAME).exists() \
+        and (output_dir / MOVEMENTS_FILENAME).exists()
+
+
+def resolve_strategy(kind: str, spec: dict):
+    """Build the `kind` ("opening" or "closing") strategy described by `spec` from the `strategies` module."""
+    import strategies
+
+    name = spec["name"]
+    prefix = f"{kind}_strategy_"
+    func = getattr(strategies, name if name.startswith(prefix) else prefix + name, None)
+    if not callable(func):
+        raise ValueError(f"unknown {kind} strategy {name!r}")
+
+    signature = inspect.signature(func)
+    is_factory = signature.return_annotation is getattr(strategies, f"{kind.capitalize()}StrategyType")
+    if not is_factory:
+        if spec.get("params"):
+            raise ValueError(f"{kind} strategy {name!r} takes no params")
+        return func
+
+    params = spec.get("params", {})
+    if not isinstance(params, dict):
+        raise ValueError(f"params of {kind} strategy {name!r} must be an object")
+    try:
+        signature.bind(**params)
+    except TypeError as e:
+        raise ValueError(f"invalid params for {kind} strategy {name!r}: {e}") from e
+    return func(**params)
+
+
+def create_data_services(data_source: str):
+    """Import and instantiate the asset and options data services for `data_source`."""
+    module_name, asset_cls_name, options_cls_name = DATA_SOURCES[data_source]
+    module = importlib.import_module(module_name)
+    return getattr(module, asset_cls_name)(), getattr(module, options_cls_name)()
+
+
+def write_each_as_json_line(movements: Iterable["NDArray"], f: IO[str]) -> Iterator["NDArray"]:
+    """Pass the P&L movements through, writing each one into `f` as a JSON line as soon as it is produced.
+    Skipped days (NaN in `potential_pnl_stream`) are written as `null`."""
+    import numpy as np
+
+    for movement in movements:
+        skipped = np.ndim(movement) == 0 and np.isnan(movement)
+        f.write(json.dumps(None if skipped else np.asarray(movement).tolist(), allow_nan=False) + "\n")
+        yield movement
+
+
+def load_pnl_movements(path: Path) -> list["NDArray"]:
+    """Read the P&L movements written by `write_each_as_json_line`, with NaN for skipped days."""
+    import numpy as np
+
+    with open(path) as f:
+        return [np.nan if movement is None else np.array(movement) for movement in map(json.loads, f)]  # type: ignore
+
+
+def run(
+    config: dict,
+    output_dir: Path,
+    opening_strategy: "OpeningStrategyType",
+    closing_strategy: "ClosingStrategyType",
+    asset_data_service: "AssetDataService",
+    options_data_service: "OptionsDataService",
+) -> None:
+    """Run the backtest described by `config` with its (already resolved) strategies and data services
+    and write its results into `output_dir`."""
+    from backtest import perform_closing_strategy, potential_pnl_stream
+
+    daily_pnl_movements = potential_pnl_stream(
+        datetime.fromisoformat(config["start_date"]),
+        datetime.fromisoformat(config["end_date"]),
+        config["asset"],
+        asset_data_service,
+        options_data_service,
+        opening_strategy,
+    )
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    with open(output_dir / MOVEMENTS_FILENAME, "w") as f:
+        profit_df = perform_closing_strategy(closing_strategy, write_each_as_json_line(daily_pnl_movements, f))
+    profit_df.to_csv(output_dir / PROFIT_FILENAME, index_label="day")
+    # written last, so that an interrupted run is never considered cached
+    (output_dir / CONFIG_FILENAME).write_text(json.dumps(config, indent=4))
+
+    daily_profit_df = profit_df.dropna().diff().dropna()
+    if daily_profit_df.shape[0] > 0:
+        print(f"Winning rate: {daily_profit_df[daily_profit_df['total_profit'] > 0].shape[0] / daily_profit_df.shape[0]:.2%}")
+    print(f"Results written to {output_dir}")
+
+
+def list_strategies() -> None:
+    """Print the names of all opening and closing strategies."""
+    import strategies
+
+    for kind in ("opening", "closing"):
+        prefix = f"{kind}_strategy_"
+        print(f"{kind.capitalize()} strategies:")
+        for name in dir(strategies):
+            if name.startswith(prefix) and callable(getattr(strategies, name)):
+                print(f"  {name[len(prefix):]}")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Run options strategy backtests from JSON run configs.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the backtests described by the given configs")
+    run_parser.add_argument("configs", nargs="+", type=Path, help="paths to JSON run configs")
+    run_parser.add_argument(
+        "--output-dir", type=Path, default=Path("results"),
+        help="directory to write results into, one `<config name>-<config hash>` subdirectory per config (default: %(default)s)",
+    )
+    run_parser.add_argument("--force", action="store_true", help="rerun even if results for the config already exist")
+
+    subparsers.add_parser("strategies", help="list the available opening and closing strategies")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "strategies":
+        list_strategies()
+        return
+
+    # validate every config (and set up the strategies and data services of those not already cached)
+    # before running any of them
+    runs = []
+    data_services = {}  # data source -> its (asset, options) data services, or the error creating them
+    failed = 0
+    for path in args.configs:
+        try:
+            config = load_config(path)
+            output_dir = output_dir_for(path, config, args.output_dir)
+            if not args.force and is_cached(config, output_dir):
+                print(f"Results for {path} are already in {output_dir}, skipping (use --force to rerun).")
+                continue
+            try:
+                opening_strategy = resolve_strategy("opening", config["opening_strategy"])
+                closing_strategy = resolve_strategy("closing", config["closing_strategy"])
+            except ValueError as e:
+                raise ValueError(f"{e} in run config {path}") from e
+        except ValueError as e:
+            print(f"{parser.prog}: error: {e}", file=sys.stderr)
+            failed += 1
+            continue
+
+        data_source = config["data_source"]
+        if data_source not in data_services:
+            try:
+                data_services[data_source] = create_data_services(data_source)
+            except Exception as e:
+                data_services[data_source] = e
+        if isinstance(data_services[data_source], Exception):
+            print(f"{parser.prog}: error: cannot set up data source {data_source!r} for {path}: {data_services[data_source]!r}", file=sys.stderr)
+            failed += 1
+            continue
+
+        runs.append((path, config, output_dir, opening_strategy, closing_strategy, *data_services[data_source]))
+
+    # a failing run (e.g. a network error) doesn't stop the others
+    for path, config, output_dir, *run_args in runs:
+        print(f"Running {path}...")
+        try:
+            run(config, output_dir, *run_args)
+        except Exception:
+            print(f"{parser.prog}: error: running {path} failed:\n{traceback.format_exc()}", file=sys.stderr)
+            failed += 1
+
+    if failed > 0:
+        parser.exit(1, f"{parser.prog}: {failed} of {len(args.configs)} configs were invalid or failed\n")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,135 @@
+"""
+Smoke test of `cli.py` with in-memory data services (see `services/fake.py`).
+`cli.py`'s own `__main__` runs the command-line interface, hence the separate script.
+
+    python cli_smoke_test.py
+"""
+
+from contextlib import redirect_stderr, redirect_stdout
+import io
+import json
+from pathlib import Path
+import tempfile
+
+import cli
+from services.fake import FakeAssetDataService, FakeOptionsDataService
+
+import numpy as np
+
+
+class MissingTuesdayOptionsDataService(FakeOptionsDataService):
+    def __init__(self):
+        super().__init__(missing_days=(2,))
+
+
+class BrokenAssetDataService(FakeAssetDataService):
+    def __init__(self):
+        raise EnvironmentError("no API keys")
+
+
+class FailingAssetDataService(FakeAssetDataService):
+    def daily_candles_data(self, start, end, ticker):
+        raise ConnectionError("network is down")
+
+
+cli.DATA_SOURCES.update({
+    "fake": ("services.fake", "FakeAssetDataService", "FakeOptionsDataService"),
+    "fake_missing_tuesday": ("__main__", "FakeAssetDataService", "MissingTuesdayOptionsDataService"),
+    "broken": ("__main__", "BrokenAssetDataService", "FakeOptionsDataService"),
+    "failing": ("__main__", "FailingAssetDataService", "FakeOptionsDataService"),
+})
+
+CONFIG = {
+    "asset": "XYZ",
+    "start_date": "2024-04-01",
+    "end_date": "2024-04-08",
+    "data_source": "fake",
+    "opening_strategy": {"name": "iron_condor_specific_minute_idx", "params": {"minute_idx": 1, "days_to_expiry": 2}},
+    "closing_strategy": {"name": "last"},
+}
+
+
+def write_config(path: Path, **overrides) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({**CONFIG, **overrides}))
+    return path
+
+
+def run_cli(*argv: str) -> tuple[int, str, str]:
+    """Return the exit code, stdout and stderr of running the CLI with the given arguments."""
+    stdout, stderr = io.StringIO(), io.StringIO()
+    with redirect_stdout(stdout), redirect_stderr(stderr):
+        try:
+            cli.main(list(argv))
+            code = 0
+        except SystemExit as e:
+            code = e.code  # type: ignore
+    return code, stdout.getvalue(), stderr.getvalue()
+
+
+if __name__ == "__main__":
+    root = Path(tempfile.mkdtemp())
+    output_root = root / "results"
+
+    print("Invalid configs are reported one by one, before running the valid ones:")
+    (root / "missing.json").write_text(json.dumps({k: v for k, v in CONFIG.items() if k != "asset"}))
+    invalid_configs = {
+        "missing keys": (root / "missing.json", "missing keys: asset"),
+        "end before start": (write_config(root / "backwards.json", start_date="2024-04-08", end_date="2024-04-01"), "end_date is before start_date"),
+        "unknown data source": (write_config(root / "source.json", data_source="nope"), "unknown data source"),
+        "unknown strategy": (write_config(root / "unknown.json", closing_strategy={"name": "nope"}), "unknown closing strategy"),
+        "factory without params": (write_config(root / "factory.json", closing_strategy={"name": "limit"}), "missing a required argument: 'limit_value'"),
+        "factory with wrong params": (write_config(root / "params.json", closing_strategy={"name": "last_n", "params": {"m": 1}}), "invalid params"),
+        "plain strategy with params": (write_config(root / "plain.json", closing_strategy={"name": "last", "params": {"n": 1}}), "takes no params"),
+    }
+    valid = write_config(root / "a" / "run.json")
+    code, out, err = run_cli("run", *(str(path) for path, _ in invalid_configs.values()), str(valid), "--output-dir", str(output_root))
+    for case, (path, message) in invalid_configs.items():
+        error = next(line for line in err.splitlines() if str(path) in line)
+        print(f"  {case}: {error}")
+        assert message in error
+    assert code == 1 and f"{len(invalid_configs)} of {len(invalid_configs) + 1} configs" in err
+    assert f"Running {valid}" in out
+
+    print("Factories are called with their params (and defaults for the omitted ones), other strategies are used as is:")
+    assert callable(cli.resolve_strategy("opening", {"name": "iron_condor_specific_minute_idx", "params": {"minute_idx": 1}}))
+    assert cli.resolve_strategy("closing", {"name": "last"}) is cli.resolve_strategy("closing", {"name": "closing_strategy_last"})
+
+    print("Results are written, with one JSON line per opening day:")
+    output_dir = cli.output_dir_for(valid, cli.load_config(valid), output_root)
+    movements = cli.load_pnl_movements(output_dir / cli.MOVEMENTS_FILENAME)
+    print(f"  {output_dir.name}: {[len(m) for m in movements]}")
+    assert [len(m) for m in movements] == [14, 14, 14, 14, 9, 4]
+    assert (output_dir / cli.PROFIT_FILENAME).exists() and (output_dir / cli.CONFIG_FILENAME).exists()
+
+    print("Skipped days are written as null and read back as NaN:")
+    skipping = write_config(root / "skipping.json", data_source="fake_missing_tuesday")
+    code, _, _ = run_cli("run", str(skipping), "--output-dir", str(output_root))
+    output_dir = cli.output_dir_for(skipping, cli.load_config(skipping), output_root)
+    lines = (output_dir / cli.MOVEMENTS_FILENAME).read_text().splitlines()
+    print(f"  {[line[:20] for line in lines]}")
+    assert code == 0 and lines[0] == lines[1] == "null"
+    assert all(np.isnan(m) for m in cli.load_pnl_movements(output_dir / cli.MOVEMENTS_FILENAME)[:2])
+
+    print("Configs with existing results are skipped, unless forced:")
+    code, out, err = run_cli("run", str(valid), str(skipping), "--output-dir", str(output_root))
+    assert code == 0 and out.count("are already in") == 2 and "Running" not in out
+    code, out, _ = run_cli("run", str(valid), "--output-dir", str(output_root), "--force")
+    assert code == 0 and "Running" in out
+
+    print("Configs with the same file name in different directories don't share results:")
+    other = write_config(root / "b" / "run.json", opening_strategy={"name": "iron_condor_specific_minute_idx", "params": {"minute_idx": 1}})
+    code, out, _ = run_cli("run", str(valid), str(other), "--output-dir", str(output_root))
+    dirs = sorted(d.name for d in output_root.iterdir() if d.name.startswith("run-"))
+    print(f"  {dirs}")
+    assert code == 0 and len(dirs) == 2 and "Running" in out and out.count("are already in") == 1
+
+    print("Failing data sources and runs are reported without stopping the others:")
+    broken = write_config(root / "broken.json", data_source="broken")
+    failing = write_config(root / "failing.json", data_source="failing")
+    code, out, err = run_cli("run", str(broken), str(failing), str(valid), "--output-dir", str(output_root), "--force")
+    assert code == 1 and "2 of 3 configs" in err
+    assert "no API keys" in err and "ConnectionError: network is down" in err
+    assert f"Results written to {cli.output_dir_for(valid, cli.load_config(valid), output_root)}" in out
+
+    print("All OK!")
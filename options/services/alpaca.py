@@ -34,8 +34,12 @@ class AlpacaOptionsDataService(OptionsDataService):
             symbol_or_symbols=tickers,
             timeframe=TimeFrame.Minute,  # type: ignore
             start=day,
+            end=day + pd.Timedelta(days=1),  # options may expire later, so only take this day's bars
         )).df  # type: ignore
 
+        if full_day_opts_df.empty:
+            return full_day_opts_df
+
         full_day_opts_nomissing_df = full_day_opts_df\
             .reindex(pd.MultiIndex.from_product([
                 tickers,
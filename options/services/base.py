@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
 from datetime import datetime
+from typing import Iterator
 
 from models import Option
 
@@ -9,6 +10,8 @@ import pandas as pd
 class OptionsDataService(ABC):
     @abstractmethod
     def full_day_minutely_data(self, day: datetime, options: list[Option]) -> pd.DataFrame:
+        """Return the minute bars of the given options during `day`, indexed by (symbol, timestamp).
+        Minutes without a bar are filled in with the latest known prices and zero volume."""
         ...
 
 
@@ -19,4 +22,11 @@ class AssetDataService(ABC):
 
     @abstractmethod
     def daily_candles_data(self, start: datetime, end: datetime, ticker: str) -> pd.DataFrame:
-        ...
\ No newline at end of file
+        ...
+
+    def minutely_data_stream(self, start: datetime, end: datetime, ticker: str) -> Iterator[tuple[datetime, pd.DataFrame]]:
+        """Yield each trading day between `start` and `end` along with its minute-level data, fetching one day at a time."""
+        df_days = self.daily_candles_data(start, end, ticker)
+        for timestamp in df_days.index.get_level_values("timestamp").unique():
+            day = timestamp.to_pydatetime()
+            yield day, self.full_day_minutely_data(day, ticker)
\ No newline at end of file
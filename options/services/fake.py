@@ -0,0 +1,77 @@
+from datetime import datetime
+
+from models import Option, OptionType
+from services.base import OptionsDataService, AssetDataService
+
+import pandas as pd
+
+
+# Mon-Fri, Mon
+TRADING_DAYS = [pd.Timestamp(f"2024-04-0{d} 04:00", tz="UTC") for d in (1, 2, 3, 4, 5, 8)]
+MINUTES_PER_DAY = 5
+
+
+def _day_minutes(day: datetime) -> pd.DatetimeIndex:
+    return pd.date_range(day.replace(hour=14, minute=30), periods=MINUTES_PER_DAY, freq="min")
+
+
+class FakeAssetDataService(AssetDataService):
+    """In-memory asset data for smoke tests: a flat $100 price on each of `TRADING_DAYS`."""
+    def __init__(self):
+        self.requested_days: list[datetime] = []
+
+    def full_day_minutely_data(self, day: datetime, ticker: str) -> pd.DataFrame:
+        self.requested_days.append(day)
+        return pd.DataFrame(
+            {"open": 100.0, "close": 100.0},
+            index=pd.MultiIndex.from_product([[ticker], _day_minutes(day)], names=["symbol", "timestamp"]),
+        )
+
+    def daily_candles_data(self, start: datetime, end: datetime, ticker: str) -> pd.DataFrame:
+        days = [d for d in TRADING_DAYS if start.date() <= d.date() <= end.date()]
+        return pd.DataFrame(
+            {"open": 100.0, "close": 100.0},
+            index=pd.MultiIndex.from_product([[ticker], days], names=["symbol", "timestamp"]),
+        )
+
+
+class FakeOptionsDataService(OptionsDataService):
+    """In-memory options data for smoke tests.
+    Contracts expiring on weekdays other than `holidays` trade each minute until their expiry,
+    except that nothing trades on `missing_days` and nothing trades during the first `late_days[day]` minutes of a day.
+    Minutes without a bar are filled in like the Alpaca service does: with $0.01 and zero volume."""
+    def __init__(
+        self,
+        missing_days: tuple[int, ...] = (),
+        holidays: tuple[int, ...] = (),
+        late_days: dict[int, int] | None = None,
+    ):
+        self.missing_days = missing_days
+        self.holidays = holidays
+        self.late_days = late_days or {}
+
+    def is_listed(self, option: Option, day: datetime) -> bool:
+        expiry = option.expiry_date
+        return expiry.weekday() < 5 and expiry.day not in self.holidays and day.date() <= expiry.date()
+
+    @staticmethod
+    def price(option: Option, ts: pd.Timestamp) -> float:
+        """Calls get more expensive over time and puts cheaper, proportionally to their strikes."""
+        sign = 1 if option.optype == OptionType.CALL else -1
+        return 2 + sign * option.strike_price / 100 * (ts.day * 0.01 + ts.minute * 0.001)
+
+    def full_day_minutely_data(self, day: datetime, options: list[Option]) -> pd.DataFrame:
+        if day.day in self.missing_days or not any(self.is_listed(opt, day) for opt in options):
+            return pd.DataFrame()
+
+        late_minutes = self.late_days.get(day.day, 0)
+        rows = {
+            (opt.ticker, ts): (self.price(opt, ts), 1)
+            if self.is_listed(opt, day) and i >= late_minutes else (0.01, 0)
+            for opt in options
+            for i, ts in enumerate(_day_minutes(day))
+        }
+        df = pd.DataFrame.from_dict(rows, orient="index", columns=["close", "volume"])
+        df.index = pd.MultiIndex.from_tuples(df.index, names=["symbol", "timestamp"])
+        df["open"] = df["close"]
+        return df
@@ -22,7 +22,9 @@ OpeningStrategyType = Callable[
 
 def opening_strategy_iron_condor_specific_minute_idx(
     minute_idx: int,
+    days_to_expiry: int = 0,
 ) -> OpeningStrategyType:
+    """`days_to_expiry` is counted in business days (holidays are not accounted for)."""
     def strategy(df_day_asset: pd.DataFrame) -> tuple[pd.Timestamp, list[OptionLeg]]:
         asset = df_day_asset.index.get_level_values("symbol").unique()[0]
         ts = df_day_asset.index.get_level_values("timestamp").unique()[minute_idx]
@@ -31,12 +33,13 @@ def opening_strategy_iron_condor_specific_minute_idx(
         current_day: datetime = ts.to_pydatetime().replace(
             hour=0, minute=0, second=0, microsecond=0
         )
+        expiry_day: datetime = (pd.Timestamp(current_day) + pd.offsets.BDay(days_to_expiry)).to_pydatetime()
         legs = iron_condor_legs_same_shorts_price(
             n_contracts=10,
             asset=asset,
             shorts_strike_price=opening_minute_price,
             wingspan=0.015,
-            dte=current_day  # 0DTE
+            dte=expiry_day
         )
         return ts, legs
     return strategy